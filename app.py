@@ -3,25 +3,28 @@ Flask web application for TSun Token Fetcher Dashboard.
 Provides a beautiful web interface with real-time updates.
 """
 
-from flask import Flask, render_template, jsonify, Response, request
+from flask import Flask, render_template, Response, request
 from dotenv import load_dotenv
+import orjson
 import asyncio
 import threading
-import json
+from concurrent.futures import ThreadPoolExecutor
 import time
 import os
+import gzip
+import hashlib
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
-from core.token_fetcher import run_token_fetch, LogCollector
+from core.token_fetcher import (
+    run_token_fetch, LogCollector,
+    GITHUB_TOKEN, GITHUB_REPO_OWNER, GITHUB_REPO_NAME, GITHUB_BASE_PATH
+)
 import db
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Database
-db.init_db()
-
 # Detect serverless environment (Vercel/Lambda)
 # Render is NOT serverless - it runs as a long-lived web service
 IS_RENDER = os.getenv('RENDER') == 'true'
@@ -37,6 +40,40 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+
+def ojsonify(obj, status=200):
+    """jsonify replacement using orjson's C encoder (much faster than stdlib json)."""
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+
+# Don't bother compressing payloads smaller than this - the gzip header
+# overhead outweighs the savings
+_COMPRESS_MIN_SIZE = 500
+
+
+@app.after_request
+def compress_json_response(response):
+    """gzip JSON bodies (history/status/health) when the client accepts it."""
+    if (response.mimetype != 'application/json'
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+    body = response.get_data()
+    if len(body) < _COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+# Single reusable worker for background runs - only one run may be active at
+# a time anyway, and reusing the thread avoids per-run spawn cost
+_run_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='token-run')
+
+# Guards the idle->running transition in trigger_run
+_run_start_lock = threading.Lock()
+
 # Global state
 job_state = {
     'status': 'idle',  # idle, running, completed
@@ -47,6 +84,78 @@ job_state = {
     'is_serverless': IS_SERVERLESS
 }
 
+# Request paths only need second-resolution timestamps, so cache the ISO
+# string and rebuild it at most once per second instead of per request
+_now_cache = {'sec': 0, 'iso': ''}
+
+
+def cached_now_iso():
+    sec = int(time.time())
+    if sec != _now_cache['sec']:
+        _now_cache['sec'] = sec
+        _now_cache['iso'] = datetime.now().isoformat(timespec='seconds')
+    return _now_cache['iso']
+
+
+# Cached /api/history response bytes - history only changes when a run
+# finishes, so the dashboard's polling shouldn't cost a DB round-trip per
+# request. The cache is per-process and gunicorn runs 2 workers: only the
+# worker that executed the run invalidates its own copy, so entries also
+# carry a short TTL to let the other worker converge after a run
+_HISTORY_CACHE_TTL = 15  # seconds
+_history_cache = {'etag': None, 'body': None, 'expires_at': 0.0}
+
+
+def _invalidate_history_cache():
+    _history_cache['body'] = None
+    _history_cache['etag'] = None
+
+
+def _etag_response(body, etag):
+    """Serve JSON bytes with an ETag, answering 304 when the client already has them.
+
+    Cache-Control: no-cache makes pollers revalidate with If-None-Match
+    instead of reusing stale bodies, so unchanged payloads cost one 304.
+    """
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='application/json', headers=headers)
+
+
+def _make_region_buffer(run_id):
+    """Buffer per-region results and write them to the DB in batches.
+
+    Returns (on_region_complete, flush). Results are flushed as one
+    multi-row insert when 8 have accumulated or more than 1s has passed
+    since the last flush, instead of one connection+commit per region.
+    Callers must invoke flush() at end-of-run (and on timeout/error) to
+    persist any buffered tail.
+    """
+    pending = []
+    lock = threading.Lock()
+    state = {'last_flush': time.monotonic()}
+
+    def flush():
+        with lock:
+            if not pending:
+                return
+            rows = pending.copy()
+            pending.clear()
+            state['last_flush'] = time.monotonic()
+        db.save_region_results_batch(run_id, rows)
+
+    def on_region_complete(region_result):
+        if not run_id:
+            return
+        with lock:
+            pending.append(region_result)
+            due = len(pending) >= 8 or (time.monotonic() - state['last_flush']) >= 1.0
+        if due:
+            flush()
+
+    return on_region_complete, flush
+
 
 def run_sync_job():
     """Run token fetch synchronously (for serverless environments)."""
@@ -55,57 +164,43 @@ def run_sync_job():
     
     job_state['status'] = 'running'
     
-    # Get next run number from database
-    db_history = db.get_history(limit=1)
-    next_run_number = (db_history[0]['run_number'] + 1) if db_history else 1
+    # Precompute run number and start timestamp once for state + DB row
+    next_run_number = db.get_next_run_number()
+    started_at = datetime.now().isoformat()
     
     job_state['current_run'] = {
-        'started_at': datetime.now().isoformat(),
+        'started_at': started_at,
         'run_number': next_run_number
     }
     job_state['log_collector'].add("🚀 Starting new token fetch run (serverless mode)", "info")
     
     # Save to Database at START
-    run_id = db.save_run(
-        job_state['current_run']['run_number'], 
-        job_state['current_run']['started_at'],
-        'running'
-    )
+    run_id = db.save_run(next_run_number, started_at, 'running')
     
-    def on_region_complete(region_result):
-        if run_id:
-            db.save_region_result(
-                run_id, region_result['region'], region_result['total'], 
-                region_result['success'], region_result['failed'], 
-                region_result.get('timed_out', 0), region_result['success_rate'], 
-                region_result['duration']
-            )
+    on_region_complete, flush_region_results = _make_region_buffer(run_id)
 
-    # Run async task with timeout
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
     try:
         # Serverless timeout: 50 seconds max
-        result = loop.run_until_complete(
+        result = asyncio.run(
             asyncio.wait_for(
                 run_token_fetch(job_state['log_collector'], job_state['stats'], on_region_complete), 
                 timeout=50
             )
         )
         
-        # Update state
+        # Update state - promote current_run in place rather than copying it
         job_state['status'] = 'completed'
-        job_state['last_run'] = {
-            **job_state['current_run'],
-            'completed_at': datetime.now().isoformat(),
-            'result': result,
-            'elapsed': result.get('elapsed', 0)
-        }
+        completed_run = job_state['current_run']
+        completed_run['completed_at'] = datetime.now().isoformat()
+        completed_run['result'] = result
+        completed_run['elapsed'] = result.get('elapsed', 0)
+        job_state['last_run'] = completed_run
         
         # Update run completion in Database
+        flush_region_results()
         if run_id:
-            db.update_run_completion(run_id, job_state['last_run']['completed_at'], job_state['last_run']['elapsed'])
+            db.update_run_completion(run_id, completed_run['completed_at'], completed_run['elapsed'])
+        _invalidate_history_cache()
 
         job_state['current_run'] = None
         
@@ -116,8 +211,10 @@ def run_sync_job():
         
     except asyncio.TimeoutError:
         job_state['status'] = 'timeout'
+        flush_region_results()
         if run_id:
             db.update_run_completion(run_id, datetime.now().isoformat(), 50, 'timeout')
+        _invalidate_history_cache()
         job_state['log_collector'].add("⏱️ Serverless timeout (50s) - partial results saved", "warning")
         
         # Clear logs after timeout
@@ -127,17 +224,16 @@ def run_sync_job():
     
     except Exception as e:
         job_state['status'] = 'error'
+        flush_region_results()
         if run_id:
             db.update_run_completion(run_id, datetime.now().isoformat(), 0, 'error')
+        _invalidate_history_cache()
         job_state['log_collector'].add(f"❌ Critical error: {str(e)}", "error")
         
         # Clear logs after error
         job_state['log_collector'].add("❌ Error - logs will be cleared", "error")
         
         return {'status': 'error', 'message': str(e)}
-    
-    finally:
-        loop.close()
 
 
 def run_async_job():
@@ -148,53 +244,39 @@ def run_async_job():
         
         job_state['status'] = 'running'
         
-        # Get next run number from database
-        db_history = db.get_history(limit=1)
-        next_run_number = (db_history[0]['run_number'] + 1) if db_history else 1
+        # Precompute run number and start timestamp once for state + DB row
+        next_run_number = db.get_next_run_number()
+        started_at = datetime.now().isoformat()
         
         job_state['current_run'] = {
-            'started_at': datetime.now().isoformat(),
+            'started_at': started_at,
             'run_number': next_run_number
         }
         job_state['log_collector'].add("🚀 Starting new token fetch run", "info")
         
         # Save to Database at START
-        run_id = db.save_run(
-            job_state['current_run']['run_number'], 
-            job_state['current_run']['started_at'],
-            'running'
-        )
-        
-        def on_region_complete(region_result):
-            if run_id:
-                db.save_region_result(
-                    run_id, region_result['region'], region_result['total'], 
-                    region_result['success'], region_result['failed'], 
-                    region_result.get('timed_out', 0), region_result['success_rate'], 
-                    region_result['duration']
-                )
-
-        # Run async task
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        run_id = db.save_run(next_run_number, started_at, 'running')
         
+        on_region_complete, flush_region_results = _make_region_buffer(run_id)
+
         try:
-            result = loop.run_until_complete(
+            result = asyncio.run(
                 run_token_fetch(job_state['log_collector'], job_state['stats'], on_region_complete)
             )
             
-            # Update state
+            # Update state - promote current_run in place rather than copying it
             job_state['status'] = 'completed'
-            job_state['last_run'] = {
-                **job_state['current_run'],
-                'completed_at': datetime.now().isoformat(),
-                'result': result,
-                'elapsed': result.get('elapsed', 0)
-            }
+            completed_run = job_state['current_run']
+            completed_run['completed_at'] = datetime.now().isoformat()
+            completed_run['result'] = result
+            completed_run['elapsed'] = result.get('elapsed', 0)
+            job_state['last_run'] = completed_run
             
             # Update run completion in Database
+            flush_region_results()
             if run_id:
-                db.update_run_completion(run_id, job_state['last_run']['completed_at'], job_state['last_run']['elapsed'])
+                db.update_run_completion(run_id, completed_run['completed_at'], completed_run['elapsed'])
+            _invalidate_history_cache()
 
             job_state['current_run'] = None
             
@@ -203,31 +285,49 @@ def run_async_job():
             
         except Exception as e:
             job_state['status'] = 'error'
+            flush_region_results()
             if run_id:
                 db.update_run_completion(run_id, datetime.now().isoformat(), 0, 'error')
+            _invalidate_history_cache()
             job_state['log_collector'].add(f"❌ Critical error: {str(e)}", "error")
             
             # Clear logs after error
             job_state['log_collector'].add("❌ Error - logs will be cleared", "error")
             
         finally:
-            loop.close()
-            # Reset to idle after 10 seconds
-            time.sleep(10)
-            job_state['status'] = 'idle'
-            
-            # Clear logs after run finishes (ephemeral logs)
-            time.sleep(2)  # Brief delay to show final message
-            job_state['log_collector'].clear()
+            # Schedule the idle reset and ephemeral log clear on timers
+            # instead of blocking this worker thread for 12 seconds. Both
+            # callbacks re-check the status first: if another run started
+            # in the meantime, a stale timer must not flip it back to idle
+            # (reopening the trigger_run gate) or wipe the new run's logs
+            def reset_to_idle():
+                if job_state['status'] in ('completed', 'error'):
+                    job_state['status'] = 'idle'
+
+            def clear_stale_logs():
+                if job_state['status'] != 'running':
+                    job_state['log_collector'].clear()
+
+            for delay, fn in ((10, reset_to_idle), (12, clear_stale_logs)):
+                timer = threading.Timer(delay, fn)
+                timer.daemon = True
+                timer.start()
     
-    thread = threading.Thread(target=async_wrapper, daemon=True)
-    thread.start()
+    _run_executor.submit(async_wrapper)
+
+
+# Rendered dashboard bytes - the template has no dynamic data (just url_for
+# asset links), so one render per process is enough
+_dashboard_cache = {'body': None}
 
 
 @app.route('/')
 def dashboard():
-    """Render the main dashboard."""
-    return render_template('dashboard.html')
+    """Serve the main dashboard (rendered once, cached for the process lifetime)."""
+    if _dashboard_cache['body'] is None:
+        _dashboard_cache['body'] = render_template('dashboard.html').encode('utf-8')
+    return Response(_dashboard_cache['body'], mimetype='text/html',
+                    headers={'Cache-Control': 'public, max-age=300'})
 
 
 @app.route('/api/run', methods=['GET', 'POST'])
@@ -238,7 +338,7 @@ def trigger_run():
     # Log every request to track who's triggering runs
     logger.warning(f"""
     ========== RUN TRIGGERED ==========
-    Time: {datetime.now().isoformat()}
+    Time: {cached_now_iso()}
     Method: {request.method}
     IP: {request.remote_addr}
     User-Agent: {request.headers.get('User-Agent', 'Unknown')}
@@ -252,7 +352,7 @@ def trigger_run():
     # Check if runs are enabled (kill switch)
     if not RUN_ENABLED:
         logger.warning("⛔ Run attempt blocked - RUN_ENABLED is False")
-        return jsonify({
+        return ojsonify({
             'error': 'Runs disabled',
             'message': 'Execution is currently disabled. Set RUN_ENABLED=true in environment variables to enable.',
             'tip': 'This prevents unauthorized automatic executions.'
@@ -263,7 +363,7 @@ def trigger_run():
     
     if provided_token != SECRET_TOKEN:
         logger.warning(f"🔒 Unauthorized run attempt from IP: {request.remote_addr}")
-        return jsonify({
+        return ojsonify({
             'error': 'Unauthorized',
             'message': 'Valid authentication token required to trigger run.',
             'tip': 'Add X-Run-Token header or ?token=your-secret query parameter'
@@ -272,42 +372,66 @@ def trigger_run():
     logger.info(f"✅ Authorized run request from IP: {request.remote_addr}")
     
     # ========== EXECUTE RUN ==========
-    if job_state['status'] == 'running':
-        return jsonify({'status': 'already_running'}), 409
-    
+    # Compare-and-set under a lock: concurrent triggers (cron + manual
+    # button) can otherwise both pass the plain status read and start
+    # duplicate runs
+    with _run_start_lock:
+        if job_state['status'] == 'running':
+            return ojsonify({'status': 'already_running'}, 409)
+        job_state['status'] = 'running'
+
     if IS_SERVERLESS:
         # Serverless: execute synchronously and return result
         result = run_sync_job()
-        return jsonify(result), 200
+        return ojsonify(result)
     else:
         # Local: execute in background thread
         run_async_job()
-        return jsonify({'status': 'started'}), 200
+        return ojsonify({'status': 'started'})
 
 
-@app.route('/api/status')
+@app.route('/api/status', methods=['GET', 'HEAD'])
 def get_status():
     """Get current job status."""
-    # Filter out non-serializable objects from stats
-    serializable_stats = {k: v for k, v in job_state['stats'].items() if k != 'rate_limit_manager'}
-    
-    return jsonify({
+    # Uptime monitors probe with HEAD and discard the body - don't build it
+    if request.method == 'HEAD':
+        return Response(status=200, headers={'Cache-Control': 'no-cache'})
+
+    # stats only holds plain serializable values now - the RateLimitManager
+    # is threaded through the fetcher explicitly instead of living here
+    body = orjson.dumps({
         'status': job_state['status'],
         'current_run': job_state['current_run'],
         'last_run': job_state['last_run'],
-        'stats': serializable_stats,
+        'stats': job_state['stats'],
         'is_serverless': IS_SERVERLESS,
         'mode': 'serverless' if IS_SERVERLESS else 'local'
     })
+    return _etag_response(body, hashlib.md5(body).hexdigest())
 
 
 @app.route('/api/logs')
 def get_logs():
     """Get recent logs as JSON (for polling-based log updates).
     Works on all platforms: Vercel, Render, and local.
+
+    Pass ?since=<seq> (or a Last-Event-ID header) to receive only entries
+    newer than that sequence number; the response's 'since' value is the
+    cursor for the next poll, so pollers stop re-downloading the whole tail.
     """
-    return jsonify({
-        'logs': job_state['log_collector'].get_recent(100),
+    collector = job_state['log_collector']
+    since = request.args.get('since') or request.headers.get('Last-Event-ID')
+    if since is not None:
+        try:
+            logs, seq = collector.get_since(int(since))
+        except ValueError:
+            return ojsonify({'error': 'since must be an integer'}, 400)
+    else:
+        logs, seq = collector.get_recent(100), collector.seq
+
+    return ojsonify({
+        'logs': logs,
+        'since': seq,
         'status': job_state['status'],
         'environment': 'render' if IS_RENDER else ('serverless' if IS_SERVERLESS else 'local')
     })
@@ -320,88 +444,109 @@ def stream_logs():
     """
     # Only allow SSE in local development mode
     if IS_SERVERLESS or IS_RENDER:
-        return jsonify({
+        return ojsonify({
             'error': 'SSE not available',
-            'message': 'Use /api/logs endpoint with polling instead',
-            'logs': job_state['log_collector'].get_recent(100)
-        }), 200
+            'message': 'Poll /api/logs?since=<seq> instead - it returns only entries newer than your cursor',
+            'logs': job_state['log_collector'].get_recent(100),
+            'since': job_state['log_collector'].seq
+        })
     
-    # Local dev: use SSE streaming
+    # Resume from the client's cursor on reconnect so the backlog isn't
+    # replayed. Read here: the generator runs outside the request context
+    try:
+        resume_seq = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        resume_seq = 0
+
+    # Local dev: use SSE streaming (event-driven, no polling)
     def generate():
-        last_count = 0
+        collector = job_state['log_collector']
+        last_seq = resume_seq
+        # Tell clients to back off 3s on reconnect instead of hammering
+        yield b"retry: 3000\n\n"
         while True:
-            logs = job_state['log_collector'].get_recent(100)
-            current_count = len(logs)
-            
-            if current_count > last_count:
-                # Send new logs
-                new_logs = logs[last_count:]
-                for log in new_logs:
-                    yield f"data: {json.dumps(log)}\n\n"
-                last_count = current_count
-            
-            time.sleep(0.5)  # Poll every 500ms
-    
-    return Response(generate(), mimetype='text/event-stream')
+            # Frames are serialized once in LogCollector.add - no per-client encoding
+            frames, new_seq = collector.get_frames_since(last_seq)
+            for i, frame in enumerate(frames):
+                # id: lets reconnecting clients resume via Last-Event-ID
+                yield b"id: %d\n" % (new_seq - len(frames) + i + 1) + frame
+            last_seq = new_seq
+
+            with collector.cond:
+                had_news = collector.cond.wait_for(lambda: collector.seq > last_seq, timeout=30)
+            if not had_news:
+                # Keepalive comment so proxies don't close the idle stream
+                yield b": keepalive\n\n"
+
+    # no-cache + X-Accel-Buffering stop proxies from buffering the chunked stream
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        'Connection': 'keep-alive'
+    })
 
 
 @app.route('/api/history')
 def get_history():
     """Get run history from database only (no browser/in-memory storage)."""
-    db_history = db.get_history(limit=10)
-    return jsonify({
-        'history': db_history,
-        'last_run': db_history[0] if db_history else None
-    })
+    if _history_cache['body'] is None or time.monotonic() >= _history_cache['expires_at']:
+        db_history = db.get_history(limit=10)
+        _history_cache['body'] = orjson.dumps({
+            'history': db_history,
+            'last_run': db_history[0] if db_history else None
+        })
+        _history_cache['etag'] = hashlib.md5(_history_cache['body']).hexdigest()
+        _history_cache['expires_at'] = time.monotonic() + _HISTORY_CACHE_TTL
+
+    return _etag_response(_history_cache['body'], _history_cache['etag'])
 
 
 @app.route('/api/config')
 def get_config():
     """Get public configuration (for frontend to know if auth is required)."""
-    return jsonify({
+    return ojsonify({
         'run_enabled': RUN_ENABLED,
         'auth_required': True,
         'message': 'Authentication token required for /api/run endpoint'
     })
 
 
+# Everything in the health payload except timestamp/last_run is fixed at
+# import time, so build it once instead of per request
+_HEALTH_STATIC = {
+    "status": "healthy",
+    "environment": "render" if IS_RENDER else ("serverless" if IS_SERVERLESS else "local"),
+    "security": {
+        "run_enabled": RUN_ENABLED,
+        "auth_required": True
+    },
+    "github": {
+        # Reuse the fetcher's import-time constants instead of re-reading the env
+        "configured": bool(GITHUB_TOKEN),
+        "repo": f"{GITHUB_REPO_OWNER}/{GITHUB_REPO_NAME}",
+        "path": GITHUB_BASE_PATH
+    },
+    "api_endpoints": [
+        "https://jwt.tsunstudio.pw/v1/auth/saeed",
+        "https://tsun-ff-jwt-api.onrender.com/v1/auth/saeed",
+        "https://jwt-tsunstudio.onrender.com/v1/auth/saeed"
+    ],
+    "configuration": {
+        "max_concurrent": 100,
+        "max_retries": 15,
+        "timeout_per_account": "180s",
+        "batch_timeout": "1200s"
+    }
+}
+
+
 @app.route('/health')
 def health():
     """Enhanced health check endpoint."""
-    # Determine environment name
-    if IS_RENDER:
-        env_name = "render"
-    elif IS_SERVERLESS:
-        env_name = "serverless"
-    else:
-        env_name = "local"
-    
-    return jsonify({
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "environment": env_name,
-        "security": {
-            "run_enabled": RUN_ENABLED,
-            "auth_required": True
-        },
-        "github": {
-            "configured": bool(os.getenv('GITHUB_TOKEN') or os.getenv('GPH') or os.getenv('VERCEL_GITHUB_TOKEN')),
-            "repo": f"{os.getenv('GITHUB_REPO_OWNER', 'TSun-FreeFire')}/{os.getenv('GITHUB_REPO_NAME', 'TSun-FreeFire-Storage')}",
-            "path": os.getenv('GITHUB_BASE_PATH', 'Spam-api')
-        },
-        "api_endpoints": [
-            "https://jwt.tsunstudio.pw/v1/auth/saeed",
-            "https://tsun-ff-jwt-api.onrender.com/v1/auth/saeed",
-            "https://jwt-tsunstudio.onrender.com/v1/auth/saeed"
-        ],
-        "configuration": {
-            "max_concurrent": 100,
-            "max_retries": 15,
-            "timeout_per_account": "180s",
-            "batch_timeout": "1200s"
-        },
-        "last_run": job_state['last_run']
-    })
+    payload = dict(_HEALTH_STATIC)
+    payload["timestamp"] = cached_now_iso()
+    payload["last_run"] = job_state['last_run']
+    return ojsonify(payload)
 
 
 if __name__ == '__main__':
@@ -6,11 +6,16 @@ This module handles the actual token fetching process.
 import aiohttp
 import asyncio
 import json
+import orjson
 import os
+import threading
 import urllib.parse
 import time
 import random
-import base64
+import binascii
+from collections import deque
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 from datetime import datetime
 
@@ -29,6 +34,16 @@ API_URLS = [
     "https://jwt-tsunstudio.onrender.com/v1/auth/saeed?uid={uid}&password={password}"
 ]
 
+# Each template is only ever filled with {uid} then {password}; split them
+# once at import so per-account URL construction is two concatenations
+# instead of re-parsing the format string on the event loop thread
+_URL_PARTS = {}
+for _template in API_URLS:
+    _head, _rest = _template.split("{uid}")
+    _mid, _tail = _rest.split("{password}")
+    _URL_PARTS[_template] = (_head, _mid, _tail)
+del _template, _head, _rest, _mid, _tail
+
 # Rate-limit optimized configuration
 MAX_CONCURRENT_PER_API = 30  # Concurrent requests per API (reduced from 100 total)
 BATCH_SIZE = 30              # Process accounts in batches
@@ -38,6 +53,20 @@ INITIAL_DELAY = 5
 MAX_DELAY = 120
 GITHUB_MAX_RETRIES = 15
 
+# How many region files may be in flight at once. Each region already fans
+# out across the 3 APIs, so this multiplies per-host pressure - keep it small
+MAX_CONCURRENT_REGIONS = 2
+
+# Connection pool tuning: overall ceiling covers 3 APIs x 30 in-flight plus
+# GitHub traffic with headroom; the per-host cap stays just above
+# MAX_CONCURRENT_PER_API so one slow API can't monopolize the pool
+CONNECTOR_LIMIT = 150
+CONNECTOR_LIMIT_PER_HOST = 40
+
+# Shared per-request timeout - passing a bare int makes aiohttp build a new
+# ClientTimeout object on every call
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
 # GitHub Configuration
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN') or os.getenv('GPH') or os.getenv('VERCEL_GITHUB_TOKEN')
 GITHUB_REPO_OWNER = os.getenv('GITHUB_REPO_OWNER', 'TSun-FreeFire')
@@ -46,64 +75,207 @@ GITHUB_BRANCH = os.getenv('GITHUB_BRANCH', 'main')
 GITHUB_BASE_PATH = os.getenv('GITHUB_BASE_PATH', 'Spam-api')
 GITHUB_API_BASE = "https://api.github.com"
 
+# Shared by every GitHub call below - built once instead of per attempt
+GITHUB_HEADERS = {
+    "Authorization": f"token {GITHUB_TOKEN}",
+    "Accept": "application/vnd.github.v3+json"
+} if GITHUB_TOKEN else {}
+
 
 class RateLimitManager:
-    """Global manager to coordinate rate limit pauses across all concurrent requests."""
-    def __init__(self):
-        self.first_error_occurred = asyncio.Event()
-        self.pause_in_progress = False
+    """Coordinates a shared rate-limit cooldown across all concurrent requests.
+
+    The first 429 opens a cooldown window that every worker observes via a
+    broadcast asyncio.Event: workers call wait_if_paused() before sending and
+    block together until the window closes. Further 429s inside the window
+    extend it instead of stacking independent sleeps.
+    """
+    def __init__(self, cooldown=5.0):
+        self.cooldown = cooldown
+        self._resume_at = 0.0
+        self._clear = asyncio.Event()
+        self._clear.set()  # set == not paused
         self.lock = asyncio.Lock()
-    
+
     async def handle_rate_limit(self, uid: str):
+        """Register a 429. Starts the shared cooldown or pushes its end out."""
         async with self.lock:
-            if not self.first_error_occurred.is_set():
-                self.first_error_occurred.set()
-                self.pause_in_progress = True
-                return True
-            return False
-    
+            was_clear = self._clear.is_set()
+            self._resume_at = max(self._resume_at, time.monotonic() + self.cooldown)
+            if was_clear:
+                self._clear.clear()
+                asyncio.create_task(self._resume_when_due())
+            return was_clear
+
+    async def _resume_when_due(self):
+        while True:
+            delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        self._clear.set()
+
+    async def wait_if_paused(self):
+        if not self._clear.is_set():
+            await self._clear.wait()
+
     def reset(self):
-        self.first_error_occurred.clear()
-        self.pause_in_progress = False
+        self._resume_at = 0.0
+        self._clear.set()
+
+
+# Both timestamp formats used below only need second resolution, and
+# strftime is costly enough to show up when hundreds of log lines and push
+# messages are produced per second
+_strftime_cache = {'sec': 0, 'hms': '', 'full': ''}
+
+
+def _timestamp_strings():
+    """Return (HH:MM:SS, YYYY-mm-dd HH:MM:SS UTC), rebuilt at most once per second."""
+    sec = int(time.time())
+    if sec != _strftime_cache['sec']:
+        now = time.localtime(sec)
+        _strftime_cache['sec'] = sec
+        _strftime_cache['hms'] = time.strftime("%H:%M:%S", now)
+        _strftime_cache['full'] = time.strftime("%Y-%m-%d %H:%M:%S UTC", now)
+    return _strftime_cache['hms'], _strftime_cache['full']
 
 
 class LogCollector:
-    """Collects logs during token fetching for dashboard display."""
+    """Collects logs during token fetching for dashboard display.
+
+    Readers can block on `cond` and use the monotonic `seq` counter to wake
+    up only when new entries arrive (no polling) and drain just the new tail
+    via `get_since()`.
+    """
     def __init__(self):
-        self.logs = []
         self.max_logs = 500
-    
+        # Bounded deques: appends past maxlen evict the oldest entry in O(1)
+        self.logs = deque(maxlen=self.max_logs)
+        self.frames = deque(maxlen=self.max_logs)  # Pre-framed SSE bytes, in lockstep with self.logs
+        self.cond = threading.Condition()
+        self.seq = 0  # Monotonic entry counter, never reset
+
     def add(self, message, level="info"):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.logs.append({
+        timestamp = _timestamp_strings()[0]
+        entry = {
             "timestamp": timestamp,
             "message": message,
             "level": level
-        })
-        if len(self.logs) > self.max_logs:
-            self.logs.pop(0)
-    
+        }
+        # Serialize once at insertion so N SSE clients share the same bytes
+        frame = ("data: " + json.dumps(entry) + "\n\n").encode("utf-8")
+        with self.cond:
+            self.logs.append(entry)
+            self.frames.append(frame)
+            self.seq += 1
+            self.cond.notify_all()
+
     def get_recent(self, count=100):
-        return self.logs[-count:] if self.logs else []
-    
+        # Lock like get_since: iterating while the run thread appends
+        # raises "deque mutated during iteration"
+        with self.cond:
+            if not self.logs:
+                return []
+            start = max(0, len(self.logs) - count)
+            return list(islice(self.logs, start, None))
+
+    def get_since(self, seq, count=100):
+        """Return (entries added after `seq`, current seq) - only the new tail."""
+        with self.cond:
+            new_count = min(self.seq - seq, len(self.logs), count)
+            if new_count <= 0:
+                return [], self.seq
+            return list(islice(self.logs, len(self.logs) - new_count, None)), self.seq
+
+    def get_frames_since(self, seq, count=100):
+        """Like get_since() but returns the pre-serialized SSE frames."""
+        with self.cond:
+            new_count = min(self.seq - seq, len(self.frames), count)
+            if new_count <= 0:
+                return [], self.seq
+            return list(islice(self.frames, len(self.frames) - new_count, None)), self.seq
+
     def clear(self):
-        self.logs = []
+        with self.cond:
+            self.logs.clear()
+            self.frames.clear()
+            # seq stays monotonic so blocked readers don't miss future entries
+
+
+# In-flight fetches keyed by UID. Region files occasionally share accounts;
+# when one does, followers await the leader's task instead of firing a
+# duplicate HTTPS request. Each entry is (task, recorder): the task mutates
+# the recorder dict, and every waiter folds it into its own region stats so
+# totals (including timed_out and api_usage) add up. Cleared per run.
+_inflight_fetches = {}
 
 
-async def fetch_token_with_timeout(session, uid, password, api_url, api_name, stats, pause_event, log_collector=None, timeout=180):
-    """Wrapper to enforce per-account timeout."""
+def _fresh_recorder():
+    return {
+        'completed': 0, 'success': 0, 'failed': 0, 'timed_out': 0,
+        'api_usage': {f"API_{i + 1}": 0 for i in range(len(API_URLS))}
+    }
+
+
+def _fold_recorder(stats, recorder):
+    for key in ('completed', 'success', 'failed', 'timed_out'):
+        stats[key] += recorder[key]
+    usage = stats['api_usage']
+    for api_name, count in recorder['api_usage'].items():
+        if count:
+            usage[api_name] += count
+
+
+async def fetch_token_with_timeout(session, uid, password, api_url, api_name, stats, rate_limit_manager, log_collector=None, timeout=180):
+    """Wrapper to enforce per-account timeout.
+
+    Hands fetch_token a deadline to check between attempts instead of
+    wrapping it in asyncio.wait_for, which allocates a timer handle and a
+    cancellation scope per account. Individual HTTP calls stay bounded by
+    REQUEST_TIMEOUT, so the budget can only be overshot by one request.
+
+    Identical UIDs already in flight are deduplicated: followers await the
+    leader's task and fold its recorder into their own stats, so every
+    region books the same outcome (success, failure or timeout). If the
+    leader is cancelled (batch timeout) it cancels the underlying task too,
+    so BATCH_TIMEOUT actually stops the work.
+    """
+    existing = _inflight_fetches.get(uid)
+    if existing is None:
+        recorder = _fresh_recorder()
+        task = asyncio.ensure_future(fetch_token(
+            session, uid, password, api_url, api_name, recorder, rate_limit_manager,
+            log_collector, deadline=time.monotonic() + timeout
+        ))
+        _inflight_fetches[uid] = (task, recorder)
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            # Propagate the batch cancellation into the real work instead
+            # of leaving it running against its 180s deadline
+            task.cancel()
+            raise
+        finally:
+            _inflight_fetches.pop(uid, None)
+        _fold_recorder(stats, recorder)
+        return result
+
+    task, recorder = existing
     try:
-        return await asyncio.wait_for(
-            fetch_token(session, uid, password, api_url, api_name, stats, pause_event, log_collector),
-            timeout=timeout
-        )
-    except asyncio.TimeoutError:
-        stats['failed'] += 1
+        result = await task
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            raise  # this waiter was cancelled, not the shared work
+        # The leader's batch was cancelled from under us: book the account
+        # as failed rather than losing it from our region's totals
         stats['completed'] += 1
-        stats['timed_out'] = stats.get('timed_out', 0) + 1
-        if log_collector:
-            log_collector.add(f"⏱️ {api_name}: Account {uid} timed out after {timeout}s", "warning")
+        stats['failed'] += 1
         return None
+    except Exception:
+        result = None
+    _fold_recorder(stats, recorder)
+    return result
 
 
 def distribute_accounts_across_apis(accounts):
@@ -132,10 +304,13 @@ def distribute_accounts_across_apis(accounts):
     return distributed
 
 
-async def process_api_batch(session, api_url, api_name, accounts, stats, pause_event, log_collector=None):
+async def process_api_batch(session, api_url, api_name, accounts, stats, rate_limit_manager, log_collector=None, on_progress=None):
     """
     Process accounts assigned to a specific API in controlled batches.
     Returns list of token results.
+
+    on_progress, if given, is called (on the loop thread) after every
+    account finishes so the caller can emit progress without polling.
     """
     if not accounts:
         return []
@@ -160,10 +335,13 @@ async def process_api_batch(session, api_url, api_name, accounts, stats, pause_e
         
         async def bounded_fetch(acc):
             async with semaphore:
-                return await fetch_token_with_timeout(
+                result = await fetch_token_with_timeout(
                     session, acc["uid"], acc["password"], 
-                    api_url, api_name, stats, pause_event, log_collector
+                    api_url, api_name, stats, rate_limit_manager, log_collector
                 )
+            if on_progress:
+                on_progress()
+            return result
         
         tasks = [bounded_fetch(acc) for acc in batch]
         batch_results = await asyncio.gather(*tasks)
@@ -182,33 +360,58 @@ async def process_api_batch(session, api_url, api_name, accounts, stats, pause_e
     return all_results
 
 
-async def fetch_token(session, uid, password, api_url, api_name, stats, pause_event, log_collector=None):
+@lru_cache(maxsize=4096)
+def _quote(value):
+    """Memoized urllib.parse.quote - accounts frequently share passwords, and
+    retried UIDs re-encode the same strings."""
+    return urllib.parse.quote(str(value))
+
+
+async def fetch_token(session, uid, password, api_url, api_name, stats, rate_limit_manager, log_collector=None, deadline=None):
     """
     Fetches a single JWT token using the ASSIGNED API only (no fallback).
     Each account is sticky to one API to distribute load evenly.
+
+    When `deadline` (time.monotonic() based) is given, retries stop once it
+    passes and the account is counted as timed out.
     """
-    encoded_uid = urllib.parse.quote(str(uid))
-    encoded_password = urllib.parse.quote(password)
-    url = api_url.format(uid=encoded_uid, password=encoded_password)
+    head, mid, tail = _URL_PARTS[api_url]
+    url = head + _quote(uid) + mid + _quote(password) + tail
     start_time = time.time()
-    
+    timed_out = False
+    # Local bindings skip the module/attribute lookups on every loop turn
+    monotonic = time.monotonic
+    loads = orjson.loads
+
     for attempt in range(MAX_RETRIES):
         try:
             if attempt > 0:
                 base_delay = min(INITIAL_DELAY * (2 ** (attempt - 1)), MAX_DELAY)
                 delay = base_delay + random.uniform(0, 5)
+                if deadline is not None and monotonic() + delay >= deadline:
+                    timed_out = True
+                    break
                 await asyncio.sleep(delay)
+
+            if deadline is not None and monotonic() >= deadline:
+                timed_out = True
+                break
             
-            async with session.get(url, ssl=False, timeout=30) as resp:
+            # Hold here while a fleet-wide rate-limit cooldown is active
+            if rate_limit_manager:
+                await rate_limit_manager.wait_if_paused()
+            
+            async with session.get(url, ssl=False, timeout=REQUEST_TIMEOUT) as resp:
                 if resp.status == 200:
-                    data = await resp.json()
+                    # orjson over the raw bytes skips aiohttp's charset probe
+                    # and the stdlib decoder on the hottest path in the run
+                    data = loads(await resp.read())
                     token = data.get("token")
                     if token:
                         stats['success'] += 1
                         stats['completed'] += 1
                         # Track which API was used
-                        stats.setdefault('api_usage', {})
-                        stats['api_usage'][api_name] = stats['api_usage'].get(api_name, 0) + 1
+                        stats['api_usage'][api_name] += 1
                         return {"token": token}
                     else:
                         if log_collector and attempt == 0:
@@ -218,19 +421,10 @@ async def fetch_token(session, uid, password, api_url, api_name, stats, pause_ev
                     if log_collector and attempt == 0:
                         log_collector.add(f"⚠️ {api_name}: Rate limit for {uid} - will retry", "warning")
                     
-                    # Coordinate pause if needed
-                    rate_limit_manager = stats.get('rate_limit_manager')
+                    # Open/extend the shared cooldown and wait it out with everyone else
                     if rate_limit_manager:
-                        is_first = await rate_limit_manager.handle_rate_limit(uid)
-                        if is_first:
-                            pause_event.set()
-                            await asyncio.sleep(5)
-                            pause_event.clear()
-                            rate_limit_manager.pause_in_progress = False
-                        else:
-                            if pause_event.is_set():
-                                await pause_event.wait()
-                                await asyncio.sleep(0.1)
+                        await rate_limit_manager.handle_rate_limit(uid)
+                        await rate_limit_manager.wait_if_paused()
                 
                 elif resp.status == 500:
                     if log_collector and attempt == 0:
@@ -239,7 +433,11 @@ async def fetch_token(session, uid, password, api_url, api_name, stats, pause_ev
                     if log_collector and attempt == 0:
                         log_collector.add(f"❓ {api_name}: Status {resp.status} for {uid}", "warning")
         
-        except (aiohttp.ClientConnectorError, asyncio.TimeoutError, json.JSONDecodeError, Exception) as e:
+        # Narrow on purpose: catching Exception here swallowed programmer
+        # bugs and broke CancelledError propagation through gather().
+        # aiohttp.ClientError covers connector/response errors,
+        # orjson.JSONDecodeError covers a garbage 200 body.
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, orjson.JSONDecodeError) as e:
             if log_collector and attempt == 0:
                 log_collector.add(f"🔌 {api_name}: {type(e).__name__} for {uid}", "warning")
         
@@ -249,28 +447,38 @@ async def fetch_token(session, uid, password, api_url, api_name, stats, pause_ev
     elapsed = time.time() - start_time
     if elapsed > 120 and log_collector:
         log_collector.add(f"🐌 {api_name}: Slow account {uid}: {elapsed:.1f}s", "warning")
-    
-    if log_collector:
+
+    if timed_out:
+        stats['timed_out'] += 1
+        if log_collector:
+            log_collector.add(f"⏱️ {api_name}: Account {uid} timed out after {elapsed:.0f}s", "warning")
+    elif log_collector:
         log_collector.add(f"❌ {api_name}: Failed {uid} after {MAX_RETRIES} attempts", "error")
-    
+
     stats['failed'] += 1
     stats['completed'] += 1
     return None
 
 
+# File SHAs observed during the current run - each push retry was repeating
+# the same GET lookup; the PUT response refreshes the entry
+_sha_cache = {}
+
+
 async def get_github_file_sha(session, filename):
-    """Get the SHA of an existing file on GitHub."""
+    """Get the SHA of an existing file on GitHub (cached for the current run)."""
+    if filename in _sha_cache:
+        return _sha_cache[filename]
+
     url = f"{GITHUB_API_BASE}/repos/{GITHUB_REPO_OWNER}/{GITHUB_REPO_NAME}/contents/{GITHUB_BASE_PATH}/{filename}"
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json"
-    }
     
     try:
-        async with session.get(url, headers=headers, ssl=False, timeout=30) as resp:
+        async with session.get(url, headers=GITHUB_HEADERS, ssl=False, timeout=REQUEST_TIMEOUT) as resp:
             if resp.status == 200:
                 data = await resp.json()
-                return data.get("sha")
+                sha = data.get("sha")
+                _sha_cache[filename] = sha
+                return sha
             return None
     except Exception:
         return None
@@ -292,11 +500,13 @@ async def push_to_github(session, filename, content, log_collector=None):
                 await asyncio.sleep(delay)
             
             sha = await get_github_file_sha(session, filename)
-            content_json = json.dumps(content, indent=2)
-            content_base64 = base64.b64encode(content_json.encode('utf-8')).decode('utf-8')
+            # orjson returns bytes directly and b2a_base64 skips the b64encode
+            # wrapper - no intermediate str/bytes copies of a multi-MB payload
+            content_bytes = orjson.dumps(content, option=orjson.OPT_INDENT_2)
+            content_base64 = binascii.b2a_base64(content_bytes, newline=False).decode('ascii')
             
             payload = {
-                "message": f"Auto-update {filename} - {time.strftime('%Y-%m-%d %H:%M:%S UTC')}",
+                "message": f"Auto-update {filename} - {_timestamp_strings()[1]}",
                 "content": content_base64,
                 "branch": GITHUB_BRANCH
             }
@@ -304,16 +514,18 @@ async def push_to_github(session, filename, content, log_collector=None):
             if sha:
                 payload["sha"] = sha
             
-            headers = {
-                "Authorization": f"token {GITHUB_TOKEN}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-            
-            async with session.put(url, json=payload, headers=headers, ssl=False, timeout=30) as resp:
+            async with session.put(url, json=payload, headers=GITHUB_HEADERS, ssl=False, timeout=REQUEST_TIMEOUT) as resp:
                 if resp.status in [200, 201]:
+                    try:
+                        _sha_cache[filename] = (await resp.json())["content"]["sha"]
+                    except Exception:
+                        _sha_cache.pop(filename, None)
                     if log_collector:
                         log_collector.add(f"✅ Pushed {filename} to GitHub", "success")
                     return True
+                if resp.status in (409, 422):
+                    # Stale SHA - drop the cached value so the retry re-reads it
+                    _sha_cache.pop(filename, None)
         
         except Exception:
             pass
@@ -323,10 +535,105 @@ async def push_to_github(session, filename, content, log_collector=None):
     return False
 
 
-async def process_region(session, account_filepath, stats, log_collector=None):
+async def push_files_to_github(session, files, log_collector=None):
+    """Push several token files to GitHub in a single commit via the Git Data API.
+
+    files maps filename -> JSON-serializable content. Builds one tree on top
+    of the branch head and advances the ref once: 4 API calls for the whole
+    run instead of 2 round-trips (SHA lookup + PUT) per file. Returns True on
+    success; callers should fall back to per-file push_to_github otherwise.
+    """
+    if not GITHUB_TOKEN:
+        if log_collector:
+            log_collector.add("❌ GitHub token not configured", "error")
+        return False
+    if not files:
+        return True
+
+    repo_base = f"{GITHUB_API_BASE}/repos/{GITHUB_REPO_OWNER}/{GITHUB_REPO_NAME}"
+
+    for attempt in range(5):
+        try:
+            if attempt > 0:
+                delay = min(INITIAL_DELAY * (2 ** (attempt - 1)), MAX_DELAY) + random.uniform(0, 5)
+                await asyncio.sleep(delay)
+
+            # Branch head commit and its tree
+            async with session.get(f"{repo_base}/git/ref/heads/{GITHUB_BRANCH}",
+                                   headers=GITHUB_HEADERS, ssl=False, timeout=REQUEST_TIMEOUT) as resp:
+                if resp.status != 200:
+                    continue
+                head_sha = (await resp.json())["object"]["sha"]
+
+            async with session.get(f"{repo_base}/git/commits/{head_sha}",
+                                   headers=GITHUB_HEADERS, ssl=False, timeout=REQUEST_TIMEOUT) as resp:
+                if resp.status != 200:
+                    continue
+                base_tree_sha = (await resp.json())["tree"]["sha"]
+
+            # One tree holding every updated file (content inlined - no blob calls)
+            tree_entries = [
+                {
+                    "path": f"{GITHUB_BASE_PATH}/{filename}",
+                    "mode": "100644",
+                    "type": "blob",
+                    "content": json.dumps(content, indent=2)
+                }
+                for filename, content in files.items()
+            ]
+            async with session.post(f"{repo_base}/git/trees",
+                                    json={"base_tree": base_tree_sha, "tree": tree_entries},
+                                    headers=GITHUB_HEADERS, ssl=False, timeout=REQUEST_TIMEOUT) as resp:
+                if resp.status != 201:
+                    continue
+                tree_sha = (await resp.json())["sha"]
+
+            message = f"Auto-update {len(files)} token files - {_timestamp_strings()[1]}"
+            async with session.post(f"{repo_base}/git/commits",
+                                    json={"message": message, "tree": tree_sha, "parents": [head_sha]},
+                                    headers=GITHUB_HEADERS, ssl=False, timeout=REQUEST_TIMEOUT) as resp:
+                if resp.status != 201:
+                    continue
+                commit_sha = (await resp.json())["sha"]
+
+            async with session.patch(f"{repo_base}/git/refs/heads/{GITHUB_BRANCH}",
+                                     json={"sha": commit_sha},
+                                     headers=GITHUB_HEADERS, ssl=False, timeout=REQUEST_TIMEOUT) as resp:
+                if resp.status == 200:
+                    if log_collector:
+                        log_collector.add(f"✅ Pushed {len(files)} token files to GitHub in one commit", "success")
+                    return True
+                # Ref moved under us (new head) - retry from the top
+
+        except Exception:
+            pass
+
+    if log_collector:
+        log_collector.add("⚠️ Batched GitHub push failed - falling back to per-file pushes", "warning")
+    return False
+
+
+def _load_accounts_sync(filepath):
+    """Blocking account-file read, run via asyncio.to_thread from process_region."""
+    return orjson.loads(Path(filepath).read_bytes())
+
+
+def _save_tokens_sync(filepath, valid_tokens):
+    """Blocking token-file write, run via asyncio.to_thread from process_region."""
+    Path(filepath).write_bytes(orjson.dumps(valid_tokens, option=orjson.OPT_INDENT_2))
+
+
+async def process_region(session, account_filepath, stats, log_collector=None, push_files=None, rate_limit_manager=None, shared_stats=None):
     """
     Process a single region's accounts using PARALLEL API distribution.
     Accounts are split evenly across all 3 APIs and processed simultaneously.
+
+    When push_files is given, the region's tokens are stashed there for a
+    single batched GitHub commit at end-of-run instead of pushed directly.
+    Pass the run-wide rate_limit_manager so concurrent regions share one
+    cooldown; a private one is created only when called standalone.
+    shared_stats, if given, receives this region's counter increments as
+    they happen so the dashboard shows live aggregate progress.
     """
     try:
         region = account_filepath.stem.split('_')[-1].lower()
@@ -334,8 +641,9 @@ async def process_region(session, account_filepath, stats, log_collector=None):
         return None
     
     try:
-        with open(account_filepath, 'r', encoding='utf-8') as f:
-            accounts = json.load(f)
+        # Read + parse in a worker thread so other regions' HTTP callbacks
+        # keep draining while multi-MB account files load
+        accounts = await asyncio.to_thread(_load_accounts_sync, account_filepath)
     except Exception as e:
         if log_collector:
             log_collector.add(f"❌ Error loading {account_filepath.name}: {str(e)}", "error")
@@ -366,33 +674,58 @@ async def process_region(session, account_filepath, stats, log_collector=None):
     stats['success'] = 0
     stats['failed'] = 0
     stats['timed_out'] = 0
+    # Pre-seed every API key so the hot success path is a single direct
+    # increment - no setdefault/.get per token
+    stats['api_usage'] = {f"API_{i + 1}": 0 for i in range(len(API_URLS))}
     
-    rate_limit_manager = RateLimitManager()
-    stats['rate_limit_manager'] = rate_limit_manager
-    pause_event = asyncio.Event()
+    if rate_limit_manager is None:
+        rate_limit_manager = RateLimitManager()
     start_time = time.time()
     
-    # Progress tracking
+    # Mirror this region's counters into the shared dashboard dict as
+    # deltas so /api/status shows live aggregate progress while regions
+    # run concurrently. Single loop thread - no locking needed.
+    _synced = {'completed': 0, 'success': 0, 'failed': 0, 'timed_out': 0}
+    _synced_usage = dict.fromkeys(stats['api_usage'], 0)
+
+    def sync_shared():
+        if shared_stats is None:
+            return
+        for key in ('completed', 'success', 'failed', 'timed_out'):
+            delta = stats[key] - _synced[key]
+            if delta:
+                shared_stats[key] += delta
+                _synced[key] = stats[key]
+        usage = shared_stats['api_usage']
+        for name, count in stats['api_usage'].items():
+            delta = count - _synced_usage[name]
+            if delta:
+                usage[name] += delta
+                _synced_usage[name] = count
+
+    if shared_stats is not None:
+        shared_stats['total'] += total
+
+    # Progress tracking: event-driven rather than a 1s polling coroutine -
+    # each completing account invokes this on the loop thread, so no lock
+    # and no wakeups while nothing is happening
     last_logged_progress = -1
-    
-    async def track_progress():
+
+    def note_progress():
         nonlocal last_logged_progress
-        while stats.get('completed', 0) < total:
-            completed = stats.get('completed', 0)
-            # Log every 10 accounts or at the very beginning
-            if completed % 10 == 0 and completed != last_logged_progress:
-                elapsed = time.time() - start_time
-                timer_str = f"{int(elapsed // 60)}m {int(elapsed % 60)}s"
-                if log_collector:
-                    log_collector.add(f"PROGRESS:{region.upper()}:{completed}/{total}:{timer_str}", "info")
-                last_logged_progress = completed
-            await asyncio.sleep(1)
-
-    progress_task = asyncio.create_task(track_progress())
-    
+        sync_shared()
+        completed = stats.get('completed', 0)
+        # Log every 10 accounts or at the very beginning
+        if completed % 10 == 0 and completed != last_logged_progress:
+            elapsed = time.time() - start_time
+            timer_str = f"{int(elapsed // 60)}m {int(elapsed % 60)}s"
+            if log_collector:
+                log_collector.add(f"PROGRESS:{region.upper()}:{completed}/{total}:{timer_str}", "info")
+            last_logged_progress = completed
+
     # Process all APIs in parallel
     api_tasks = [
-        process_api_batch(session, api_url, api_name, accounts_group, stats, pause_event, log_collector)
+        process_api_batch(session, api_url, api_name, accounts_group, stats, rate_limit_manager, log_collector, on_progress=note_progress)
         for api_url, api_name, accounts_group in api_distribution
     ]
     
@@ -411,7 +744,7 @@ async def process_region(session, account_filepath, stats, log_collector=None):
             log_collector.add(f"⏱️ {region.upper()} batch timeout after 20 minutes", "error")
         results = [None] * total
     finally:
-        progress_task.cancel()
+        sync_shared()  # fold any tail not yet mirrored
         # Final progress log
         elapsed = time.time() - start_time
         timer_str = f"{int(elapsed // 60)}m {int(elapsed % 60)}s"
@@ -423,18 +756,21 @@ async def process_region(session, account_filepath, stats, log_collector=None):
     timed_out_count = stats.get('timed_out', 0)
     
     # Log API usage stats
-    if 'api_usage' in stats and stats['api_usage'] and log_collector:
+    if stats.get('api_usage') and log_collector:
         for api_name, count in sorted(stats['api_usage'].items()):
-            log_collector.add(f"📈 {api_name}: {count} successful tokens", "info")
+            if count:
+                log_collector.add(f"📈 {api_name}: {count} successful tokens", "info")
     
-    # Save locally
-    TOKENS_DIR.mkdir(parents=True, exist_ok=True)
     token_filename = f'token_{region}.json'
-    token_save_path = TOKENS_DIR / token_filename
     
     try:
-        with open(token_save_path, "w", encoding="utf-8") as f:
-            json.dump(valid_tokens, f, indent=2)
+        # On serverless the local copy is written to ephemeral /tmp and
+        # deleted right after the push - skip the round-trip entirely and
+        # push straight from memory
+        if not IS_SERVERLESS:
+            TOKENS_DIR.mkdir(parents=True, exist_ok=True)
+            token_save_path = TOKENS_DIR / token_filename
+            await asyncio.to_thread(_save_tokens_sync, token_save_path, valid_tokens)
         
         summary = f"✅ {region.upper()} Complete: {len(valid_tokens)}/{total} tokens"
         if timed_out_count > 0:
@@ -443,12 +779,15 @@ async def process_region(session, account_filepath, stats, log_collector=None):
         if log_collector:
             log_collector.add(summary, "success")
         
-        # Push to GitHub
-        await push_to_github(session, token_filename, valid_tokens, log_collector)
+        # Push to GitHub (or stash for the end-of-run batched commit)
+        if push_files is not None:
+            push_files[token_filename] = valid_tokens
+        else:
+            await push_to_github(session, token_filename, valid_tokens, log_collector)
         
         # Cleanup local file
-        if token_save_path.exists():
-            token_save_path.unlink()
+        if not IS_SERVERLESS and token_save_path.exists():
+            await asyncio.to_thread(token_save_path.unlink)
     
     except Exception as e:
         if log_collector:
@@ -484,22 +823,76 @@ async def run_token_fetch(log_collector=None, stats=None, on_region_complete=Non
         stats = {}
     else:
         stats.clear() # Reset stats for new run
+    _sha_cache.clear()  # SHAs from a previous run are stale by definition
+    _inflight_fetches.clear()
     start_time = time.time()
     
-    # Total concurrent connections: 3 APIs * 30 per API = 90, set limit to 100 for safety
-    connector = aiohttp.TCPConnector(limit=100, ssl=False)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        for filepath in account_files:
-            region_result = await process_region(session, filepath, stats, log_collector)
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTOR_LIMIT,
+        limit_per_host=CONNECTOR_LIMIT_PER_HOST,
+        ttl_dns_cache=300,
+        ssl=False
+    )
+    # Regions run concurrently (bounded); each gets its own stats dict and
+    # mirrors its counter increments into the shared dashboard dict as they
+    # happen, so /api/status shows live aggregate progress
+    region_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REGIONS)
+    active_regions = set()
+    stats.update({
+        'total': 0, 'completed': 0, 'success': 0, 'failed': 0, 'timed_out': 0,
+        'api_usage': {f"API_{i + 1}": 0 for i in range(len(API_URLS))}
+    })
+
+    def sync_active_regions():
+        stats['current_region'] = ', '.join(sorted(active_regions)) if active_regions else None
+
+    push_files = {}
+    # One cooldown shared by every region: all of them hit the same 3 API
+    # hosts, so a 429 seen by one region must pause the others too
+    rate_limit_manager = RateLimitManager()
+
+    # json_serialize routes the GitHub PUT payloads (json=...) through orjson
+    # instead of stdlib json; trust_env=False skips per-request proxy/netrc
+    # lookups we never use
+    async with aiohttp.ClientSession(
+        connector=connector,
+        json_serialize=lambda obj: orjson.dumps(obj).decode(),
+        raise_for_status=False,
+        trust_env=False,
+        headers={"User-Agent": "TSun-Updater"}
+    ) as session:
+        async def run_region(filepath):
+            region_label = filepath.stem.split('_')[-1].upper()
+            region_stats = {}
+            async with region_semaphore:
+                active_regions.add(region_label)
+                sync_active_regions()
+                try:
+                    region_result = await process_region(session, filepath, region_stats, log_collector, push_files, rate_limit_manager, shared_stats=stats)
+                finally:
+                    active_regions.discard(region_label)
+                    sync_active_regions()
+
             if region_result:
                 results.append(region_result)
-                # Trigger callback for incremental updates (e.g., database save)
+                # Trigger callback for incremental updates (e.g., database
+                # save). Run it in a worker thread: the callback may open a
+                # DB connection and commit, and that round-trip must not
+                # stall the other region's in-flight responses
                 if on_region_complete:
                     try:
-                        on_region_complete(region_result)
+                        await asyncio.to_thread(on_region_complete, region_result)
                     except Exception as e:
                         if log_collector:
                             log_collector.add(f"⚠️ Callback error: {str(e)}", "warning")
+
+        await asyncio.gather(*(run_region(filepath) for filepath in account_files))
+
+        # All regions land in one GitHub commit; fall back to per-file
+        # contents-API pushes if the batched path fails
+        if push_files and not await push_files_to_github(session, push_files, log_collector):
+            for token_filename, tokens in push_files.items():
+                await push_to_github(session, token_filename, tokens, log_collector)
     
     elapsed = time.time() - start_time
     
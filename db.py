@@ -1,4 +1,5 @@
 import os
+import threading
 import psycopg
 from psycopg.rows import dict_row
 from datetime import datetime
@@ -8,6 +9,20 @@ load_dotenv()
 
 DATABASE_URL = os.getenv('DATABASE_URL')
 
+# Schema creation happens lazily on first DB use rather than at app import,
+# which keeps serverless cold starts off the Postgres round-trip path
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def ensure_schema():
+    global _schema_ready
+    if _schema_ready or not DATABASE_URL:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            init_db()
+            _schema_ready = True
+
 def get_connection():
     if not DATABASE_URL:
         return None
@@ -54,7 +69,24 @@ def init_db():
     finally:
         conn.close()
 
+def get_next_run_number():
+    """Next run_number via MAX() - avoids the full get_history join just to count runs."""
+    ensure_schema()
+    conn = get_connection()
+    if not conn:
+        return 1
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(MAX(run_number), 0) + 1 FROM runs")
+            return cur.fetchone()[0]
+    except Exception as e:
+        print(f"Error fetching next run number: {e}")
+        return 1
+    finally:
+        conn.close()
+
 def save_run(run_number, started_at, status='running'):
+    ensure_schema()
     conn = get_connection()
     if not conn:
         return None
@@ -74,6 +106,7 @@ def save_run(run_number, started_at, status='running'):
         conn.close()
 
 def update_run_completion(run_id, completed_at, duration, status='completed'):
+    ensure_schema()
     conn = get_connection()
     if not conn:
         return
@@ -90,6 +123,7 @@ def update_run_completion(run_id, completed_at, duration, status='completed'):
         conn.close()
 
 def save_region_result(run_id, region, total, success, failed, timed_out, success_rate, duration):
+    ensure_schema()
     conn = get_connection()
     if not conn:
         return
@@ -105,7 +139,37 @@ def save_region_result(run_id, region, total, success, failed, timed_out, succes
     finally:
         conn.close()
 
+def save_region_results_batch(run_id, region_results):
+    """Insert multiple region results in a single connection/transaction.
+
+    One round-trip commit instead of one connection + commit per region,
+    which matters a lot on serverless Postgres (Neon) where each
+    connection costs tens of milliseconds.
+    """
+    if not region_results:
+        return
+    ensure_schema()
+    conn = get_connection()
+    if not conn:
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.executemany(
+                "INSERT INTO region_results (run_id, region, total_accounts, success_count, failed_count, timed_out_count, success_rate, duration_seconds) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                [
+                    (run_id, r['region'], r['total'], r['success'], r['failed'],
+                     r.get('timed_out', 0), r['success_rate'], r['duration'])
+                    for r in region_results
+                ]
+            )
+            conn.commit()
+    except Exception as e:
+        print(f"Error saving region results batch: {e}")
+    finally:
+        conn.close()
+
 def get_history(limit=10):
+    ensure_schema()
     conn = get_connection()
     if not conn:
         return []